@@ -5,49 +5,112 @@
  the original source and write a condensed repodata.json only having our
  vendored packages.
 """
+from __future__ import annotations
+
 import hashlib
+import hmac
 import json
-import struct
+import os
+import re
 import sys
+import tempfile
+import threading
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from functools import lru_cache
+from itertools import repeat
 from pathlib import Path
 from pprint import pformat
 from shlex import split
-from shutil import which
+from shutil import copyfile, which
 from subprocess import check_output
-from typing import List, Union
+from typing import TYPE_CHECKING, List, Optional, Set, Union
+from urllib.parse import urljoin, urlparse
 
 import click
-import requests
+import ijson
+import msgpack
+import orjson
+import pkg_resources
+import platformdirs
 import yaml
+import zstandard
 
 from packaging import version
-from requests.adapters import HTTPAdapter
-from requests.packages.urllib3.util.retry import Retry
-from ruamel.yaml import YAML
 
+# conda-lock (which pulls in most of conda) and requests are slow to import,
+# they are imported where they are used so commands that don't need them,
+# e.g. conda-vendor --help, start quickly
+if TYPE_CHECKING:
+    import requests
 
-from conda_lock import __version__ as conda_lock_version
-from conda_lock.conda_solver import (
-    DryRunInstall,
-    FetchAction,
-)
-from conda_lock.conda_solver import (
-    _reconstruct_fetch_actions as reconstruct_fetch_actions,
-)
-from conda_lock.conda_solver import solve_specs_for_arch
-from conda_lock.invoke_conda import is_micromamba
-from conda_lock.src_parser import LockSpecification
-from conda_lock.src_parser.environment_yaml import parse_environment_file
-from conda_lock.virtual_package import (
-    FakeRepoData,
-    default_virtual_package_repodata,
-    virtual_package_repo_from_specification,
-)
+    from conda_lock.conda_solver import DryRunInstall, FetchAction
+    from conda_lock.src_parser import LockSpecification
+    from conda_lock.virtual_package import FakeRepoData
 
 from conda_vendor.version import __version__
 
 
+# number of packages downloaded concurrently by download_packages
+_DOWNLOAD_WORKERS = 8
+
+# the requests.Session shared by all downloads, see _get_session().  The
+# pool is big enough for the package downloads and the (nested) repodata
+# shard downloads to all keep their connections alive
+_SESSION = None
+_SESSION_LOCK = threading.Lock()
+_SESSION_POOL_SIZE = 32
+
+# output of background threads held back while the package download
+# progress bar owns the terminal, see _defer_background_output()
+_DEFERRED_OUTPUT = None
+_OUTPUT_LOCK = threading.Lock()
+
+# the parameters of conda-lock's parse_environment_file changed in 1.3.0, it
+# also takes the platforms to parse for.  Read conda-lock's version from its
+# metadata so conda-lock itself isn't imported
+try:
+    _PARSE_ENV_NEEDS_PLATFORM = version.parse(
+        pkg_resources.get_distribution("conda_lock").version
+    ) >= version.parse("1.3.0")
+except pkg_resources.DistributionNotFound:
+    _PARSE_ENV_NEEDS_PLATFORM = True
+
+# size of the chunks packages are streamed, hashed and written in.  hashlib
+# releases the GIL while hashing large buffers, big chunks keep the download
+# threads hashing in parallel
+_CHUNK_SIZE = 4 * 1024 * 1024
+
+# tempfile creates files only their owner can read, the vendored packages
+# get the mode open() would give them.  Reading the umask means setting it,
+# do it once on import rather than from the download threads
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+# use libyaml's parser and emitter when PyYAML was built with it
+_YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+_YAML_DUMPER = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+
+
+class ChecksumError(Exception):
+    """raised when a downloaded package doesn't match its sha256 checksum"""
+
+    def __init__(self, pkg: dict):
+        super().__init__(f"SHA256 Checksum Validation Failed for {pkg['fn']}")
+        self.pkg = pkg
+
+
+class DownloadCancelled(Exception):
+    """raised by a download once another part of the run has failed"""
+
+
+def _check_cancelled(cancel: Optional[threading.Event]):
+    if cancel is not None and cancel.is_set():
+        raise DownloadCancelled()
+
+
 #  conda-lock:
 #  the solution returned by conda-lock is essentially a dictionary with
 #  {
@@ -79,43 +142,88 @@ from conda_vendor.version import __version__
 #      version: str
 
 
+def _output_deferred() -> bool:
+    """True if output from the current thread is being held back by
+    _defer_background_output()"""
+    return (
+        _DEFERRED_OUTPUT is not None
+        and threading.current_thread() is not threading.main_thread()
+    )
+
+
+def _echo(msg: str):
+    with _OUTPUT_LOCK:
+        if _output_deferred():
+            _DEFERRED_OUTPUT.append(msg)
+            return
+    click.echo(msg)
+
+
+@contextmanager
+def _defer_background_output():
+    """Hold back the output of every thread but the main thread and write
+    it once the block exits, so work running in the background doesn't
+    write into the middle of the main thread's progress bar."""
+    global _DEFERRED_OUTPUT
+    with _OUTPUT_LOCK:
+        _DEFERRED_OUTPUT = []
+    try:
+        yield
+    finally:
+        with _OUTPUT_LOCK:
+            deferred, _DEFERRED_OUTPUT = _DEFERRED_OUTPUT, None
+        for msg in deferred:
+            click.echo(msg)
+
+
 def _blue(msg: str, bold: bool = True):
-    click.echo(click.style(msg, fg="blue", bg="black", bold=bold))
+    _echo(click.style(msg, fg="blue", bg="black", bold=bold))
 
 
 def _cyan(msg: str, bold: bool = True):
-    click.echo(click.style(msg, fg="cyan", bg="black", bold=bold))
+    _echo(click.style(msg, fg="cyan", bg="black", bold=bold))
 
 
 def _green(msg: str, bold: bool = True):
-    click.echo(click.style(msg, fg="green", bg="black", bold=bold))
+    _echo(click.style(msg, fg="green", bg="black", bold=bold))
 
 
 def _red(msg: str, bold: bool = True):
-    click.echo(click.style(msg, fg="red", bg="black", bold=bold))
+    _echo(click.style(msg, fg="red", bg="black", bold=bold))
 
 
 def _yellow(msg: str, bold: bool = True):
-    click.echo(click.style(msg, fg="yellow", bg="black", bold=bold))
+    _echo(click.style(msg, fg="yellow", bg="black", bold=bold))
 
 
 def _generate_lock_spec(
     environment_file: Path, platform: str
 ) -> LockSpecification:
-    # the function parameters changed in conda-lock 1.3.0
-    if version.parse(conda_lock_version) < version.parse("1.3.0"):
-        # pylint: disable=no-value-for-parameter
-        return parse_environment_file(environment_file)
-    else:
+    from conda_lock.src_parser.environment_yaml import parse_environment_file
+
+    if _PARSE_ENV_NEEDS_PLATFORM:
         return parse_environment_file(environment_file, [platform])
+    # pylint: disable=no-value-for-parameter
+    return parse_environment_file(environment_file)
+
+
+@lru_cache(maxsize=None)
+def _load_environment_file(environment_file: str, mtime_ns: int) -> dict:
+    """parse the environment.yaml, cached on its path and modification time
+    so it is only parsed again if it changed"""
+
+    with open(environment_file, "r") as f:
+        return yaml.load(f, Loader=_YAML_LOADER)
 
 
 def _get_environment_name(environment_file: Path) -> str:
     """find the name of the environment from the environment.yaml"""
 
-    with open(environment_file, "r") as f:
-        _yaml = yaml.safe_load(f)
-        return _yaml["name"]
+    environment_file = Path(environment_file)
+    _yaml = _load_environment_file(
+        str(environment_file), environment_file.stat().st_mtime_ns
+    )
+    return _yaml["name"]
 
 
 def _get_virtual_packages(
@@ -135,6 +243,11 @@ def _get_virtual_packages(
     platform: str
         platform to solve for virtual packages for
     """
+    from conda_lock.virtual_package import (
+        default_virtual_package_repodata,
+        virtual_package_repo_from_specification,
+    )
+
     if virtual_package_spec is not None:
         if isinstance(virtual_package_spec, str):
             virtual_package_spec = Path(virtual_package_spec)
@@ -191,27 +304,25 @@ def _remove_channel(
         which solver to use.  Micromamba has a different form for "LINK" actions
         than conda or mamba
     """
-    fetch = []
-    link = []
+    from conda_lock.invoke_conda import is_micromamba
 
-    for entry in solution["actions"]["FETCH"]:
-        if entry["channel"].startswith(channel):
-            continue
-        fetch.append(entry)
+    actions = solution["actions"]
+    actions["FETCH"] = [
+        entry
+        for entry in actions["FETCH"]
+        if not entry["channel"].startswith(channel)
+    ]
 
     if not is_micromamba(solver):
-        for entry in solution["actions"]["LINK"]:
-            if entry["base_url"] == channel:
-                continue
-            link.append(entry)
+        actions["LINK"] = [
+            entry for entry in actions["LINK"] if entry["base_url"] != channel
+        ]
     else:
-        for entry in solution["actions"]["LINK"]:
-            if entry["channel"].startswith(channel):
-                continue
-            link.append(entry)
-
-    solution["actions"]["FETCH"] = fetch
-    solution["actions"]["LINK"] = link
+        actions["LINK"] = [
+            entry
+            for entry in actions["LINK"]
+            if not entry["channel"].startswith(channel)
+        ]
     return solution
 
 
@@ -281,6 +392,11 @@ def solve_environment(
     list [ conda_lock.conda_solver.FetchAction ]
 
     """
+    from conda_lock.conda_solver import (
+        _reconstruct_fetch_actions as reconstruct_fetch_actions,
+    )
+    from conda_lock.conda_solver import solve_specs_for_arch
+
     assert isinstance(environment_file, Path)
 
     # generate conda-lock's LockSpecification, this will parse the environment
@@ -316,7 +432,50 @@ def solve_environment(
 
 # pylint: disable=line-too-long
 # see https://stackoverflow.com/questions/21371809/cleanly-setting-max-retries-on-python-requests-get-or-post-method
-def _improved_download(url: str):
+def _create_session(pool_size: int = 10) -> requests.Session:
+    """Create a requests.Session that retries failed connections.  The
+    session can be shared between threads, each thread will get its own
+    connection from the pool.  Use _get_session() to get the session
+    shared by all downloads.
+
+    Parameters
+    ----------
+    pool_size: int
+        maximum number of connections kept open per host
+
+    Returns
+    -------
+    requests.Session
+    """
+    import requests
+
+    from requests.adapters import HTTPAdapter
+    from requests.packages.urllib3.util.retry import Retry
+
+    session = requests.Session()
+    retry = Retry(connect=5, backoff_factor=0.5)
+    adapter = HTTPAdapter(
+        max_retries=retry, pool_connections=pool_size, pool_maxsize=pool_size
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def _get_session() -> requests.Session:
+    """Get the session shared by all downloads, it is created on first use.
+    Reusing one session keeps the connections (and TLS handshakes) to the
+    channel's servers alive between downloads.
+    """
+    global _SESSION  # pylint: disable=global-statement
+
+    with _SESSION_LOCK:
+        if _SESSION is None:
+            _SESSION = _create_session(_SESSION_POOL_SIZE)
+        return _SESSION
+
+
+def _improved_download(url: str, stream: bool = False, headers: dict = None):
     """Wrapper arround request.get() to allow for retries
 
     Parameters
@@ -324,27 +483,402 @@ def _improved_download(url: str):
     url: str
         url to fetch
 
+    stream: bool
+        if True, only the headers are fetched and the body is read
+        on demand, e.g. with response.iter_content()
+
+    headers: dict
+        additional HTTP headers to send with the request
+
     Returns
     -------
     request.Response
         response object containing the fetched file
     """
-    session = requests.Session()
-    retry = Retry(connect=5, backoff_factor=0.5)
-    adapter = HTTPAdapter(max_retries=retry)
-    session.mount("http://", adapter)
-    session.mount("https://", adapter)
-    return session.get(url)
+    return _get_session().get(url, stream=stream, headers=headers)
+
+
+def _correct_channels(package_list: List[FetchAction]):
+    """
+    Sometimes the "url" field in the repodata.json points to the conda-forge/linux-64
+    channel while the "channel" in the repodata.json points to conda-forge/noarch.
+    When this happens, the channel is corrected to point to conda-forge/linux-64.
+    And Vice Versa, linux-64 channels are corrected to noarch when the url field is noarch.
+    Who Da What A???? wa Conda forever.
+
+    Parameters
+    ----------
+    package_list: List[FetchAction]
+        list of packages to vendor, the "channel" of each package is
+        corrected in place
+    """
+    linux_channel = 'https://conda.anaconda.org/conda-forge/linux-64'
+    noarch_channel = 'https://conda.anaconda.org/conda-forge/noarch'
+
+    for pkg in package_list:
+        if linux_channel in pkg['url'] and noarch_channel in pkg['channel']:
+            pkg['channel'] = linux_channel
+            continue
+        if noarch_channel in pkg['url'] and linux_channel in pkg['channel']:
+            pkg['channel'] = noarch_channel
+
+
+def _get_cache_dir() -> Path:
+    """location of conda-vendor's on disk cache, e.g. ~/.cache/conda-vendor"""
+    return Path(platformdirs.user_cache_dir("conda-vendor"))
+
+
+def _write_cache_file(path: Path, data: bytes):
+    """write data to path in the on disk cache, the data is written to a
+    temporary file first and moved into place so a concurrent (or
+    interrupted) run never sees a partially written file"""
+    f = tempfile.NamedTemporaryFile(dir=path.parent, delete=False)
+    try:
+        with f:
+            f.write(data)
+        os.replace(f.name, path)
+    except BaseException:
+        os.unlink(f.name)
+        raise
+
+
+def _fetch_cached_repodata(
+    url: str, required: bool = True, cancel: threading.Event = None
+) -> Optional[Path]:
+    """Make sure the on disk cache holds an up to date copy of the
+    repodata (repodata.json or shard index) at url and return its location.
+    The ETag and Last-Modified headers of the cached copy are sent along
+    with the request, if the server responds 304 Not Modified the cached
+    copy is reused instead of downloading the repodata again.
+
+    Parameters
+    ----------
+    url: str
+        url of the repodata
+
+    required: bool
+        if True exit when the server responds with an error, otherwise
+        return None
+
+    cancel: threading.Event
+        optional, stop downloading (raise DownloadCancelled) once it is set
+
+    Returns
+    -------
+    pathlib.Path
+        location of the cached repodata
+    """
+    cache_dir = _get_cache_dir() / "repodata"
+    cache_dir.mkdir(parents=True, exist_ok=True)
+
+    key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+    suffix = Path(urlparse(url).path).suffix
+    cached = cache_dir / f"{key}{suffix}"
+    meta_file = cache_dir / f"{key}.meta.json"
+
+    headers = {}
+    if cached.exists() and meta_file.exists():
+        meta = orjson.loads(meta_file.read_bytes())
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+    response = _improved_download(url, stream=True, headers=headers)
+    with response:
+        if response.status_code == 304:
+            return cached
+
+        if response.status_code >= 400:
+            if not required:
+                return None
+            _red(f"Download Failed for {url}")
+            _red(f"server responded: {response.status_code}")
+            sys.exit(1)
+
+        # write to a temporary file first and move it into place so a
+        # concurrent (or interrupted) run never sees a partial repodata.json
+        f = tempfile.NamedTemporaryFile(dir=cache_dir, delete=False)
+        try:
+            with f:
+                for chunk in response.iter_content(chunk_size=_CHUNK_SIZE):
+                    _check_cancelled(cancel)
+                    f.write(chunk)
+            os.replace(f.name, cached)
+        except BaseException:
+            os.unlink(f.name)
+            raise
+
+    meta = {
+        "url": url,
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+    }
+    _write_cache_file(meta_file, orjson.dumps(meta))
+    return cached
+
+
+def _download_repodata(
+    url: str, wanted: Set[str], cancel: threading.Event = None
+) -> dict:
+    """Fetch a channel's repodata.json and keep only the entries for the
+    packages in wanted.  The repodata.json is cached on disk (see
+    _fetch_cached_repodata) and parsed incrementally with ijson, so the
+    (potentially huge) channel repodata is never loaded into memory as a
+    whole.  This is run on a worker thread by _fetch_live_repodata.
+
+    Parameters
+    ----------
+    url: str
+        url of the repodata.json
+
+    wanted: set [ str ]
+        filenames of the packages to keep
+
+    cancel: threading.Event
+        optional, stop downloading (raise DownloadCancelled) once it is set
+
+    Returns
+    -------
+    dict
+        the channel's "packages" and "packages.conda" entries for the
+        packages in wanted
+    """
+    repo_data = {"packages": {}, "packages.conda": {}}
+
+    cached = _fetch_cached_repodata(url, cancel=cancel)
+    with cached.open("rb") as f:
+        for key, entries in repo_data.items():
+            f.seek(0)
+            for fn, entry in ijson.kvitems(f, key, use_float=True):
+                _check_cancelled(cancel)
+                if fn in wanted:
+                    entries[fn] = entry
+
+    return repo_data
+
+
+def _load_msgpack_zst(data: bytes) -> dict:
+    """decompress and unpack a zstd compressed msgpack document"""
+    decompressor = zstandard.ZstdDecompressor().decompressobj()
+    return msgpack.unpackb(decompressor.decompress(data))
+
+
+def _fetch_shard(
+    url: str, cancel: threading.Event = None
+) -> Optional[bytes]:
+    """Fetch a single repodata shard.  Shards are named after the sha256 of
+    their content so once downloaded they never change, they are kept in
+    the on disk cache and reused without asking the server.
+
+    Parameters
+    ----------
+    url: str
+        url of the shard
+
+    cancel: threading.Event
+        optional, stop downloading (raise DownloadCancelled) once it is set
+
+    Returns
+    -------
+    bytes
+        the compressed shard, or None if the shard couldn't be downloaded
+        or its content doesn't match its name
+    """
+    from requests.exceptions import RequestException
+
+    cache_dir = _get_cache_dir() / "shards"
+    cache_dir.mkdir(parents=True, exist_ok=True)
+
+    cached = cache_dir / url.rsplit("/", 1)[-1]
+    if cached.exists():
+        return cached.read_bytes()
+
+    _check_cancelled(cancel)
+    try:
+        response = _improved_download(url)
+        if response.status_code >= 400:
+            return None
+        data = response.content
+    except RequestException:
+        return None
+
+    # never cache a corrupted (or truncated) shard under its sha256
+    if hashlib.sha256(data).hexdigest() != cached.name.split(".")[0]:
+        return None
+
+    _write_cache_file(cached, data)
+    return data
+
+
+def _download_repodata_shards(
+    chan: str, packages: List[FetchAction], cancel: threading.Event = None
+) -> Optional[dict]:
+    """Fetch the repodata for packages from the channel's sharded repodata
+    (conda CEP-16).  Only the shard index and the shards of the packages
+    being vendored are downloaded, rather than the repodata of the whole
+    channel.
+
+    Parameters
+    ----------
+    chan: str
+        channel url including the subdirectory, e.g.
+        https://conda.anaconda.org/conda-forge/noarch
+
+    packages: list [ conda_lock.conda_solver.FetchAction ]
+        packages from chan to vendor
+
+    cancel: threading.Event
+        optional, stop downloading (raise DownloadCancelled) once it is set
+
+    Returns
+    -------
+    dict
+        the channel's "packages" and "packages.conda" entries for packages,
+        or None if the channel doesn't provide sharded repodata or the
+        shards don't contain every package
+    """
+    from requests.exceptions import RequestException
+
+    index_url = f"{chan}/repodata_shards.msgpack.zst"
+    try:
+        cached = _fetch_cached_repodata(
+            index_url, required=False, cancel=cancel
+        )
+    except RequestException:
+        return None
+    if cached is None:
+        return None
+
+    names = {pkg["name"] for pkg in packages}
+    try:
+        index = _load_msgpack_zst(cached.read_bytes())
+        shards_base_url = urljoin(index_url, index["info"]["shards_base_url"])
+        if not shards_base_url.endswith("/"):
+            shards_base_url += "/"
+        shard_urls = [
+            f"{shards_base_url}{index['shards'][name].hex()}.msgpack.zst"
+            for name in names
+        ]
+    except (zstandard.ZstdError, ValueError, KeyError, TypeError):
+        return None
+
+    _yellow(f"Downloading {len(shard_urls)} repodata shards from {chan}")
+    with ThreadPoolExecutor(max_workers=_DOWNLOAD_WORKERS) as executor:
+        shards = list(executor.map(_fetch_shard, shard_urls, repeat(cancel)))
+    if None in shards:
+        return None
+
+    wanted = {pkg["fn"] for pkg in packages}
+    repo_data = {"packages": {}, "packages.conda": {}}
+    try:
+        for shard in shards:
+            shard = _load_msgpack_zst(shard)
+            for key, entries in repo_data.items():
+                shard_entries = shard.get(key, {})
+                # shards store the checksums as raw bytes
+                entries.update(
+                    {
+                        fn: {
+                            k: v.hex() if isinstance(v, bytes) else v
+                            for k, v in shard_entries[fn].items()
+                        }
+                        for fn in shard_entries.keys() & wanted
+                    }
+                )
+    except (zstandard.ZstdError, ValueError, KeyError, TypeError):
+        return None
+
+    if len(repo_data["packages"]) + len(repo_data["packages.conda"]) < len(
+        wanted
+    ):
+        return None
+    return repo_data
+
+
+def _download_channel_repodata(
+    chan: str, packages: List[FetchAction], cancel: threading.Event = None
+) -> dict:
+    """Fetch the repodata entries for packages from the channel chan.  The
+    sharded repodata is used if the channel provides it, otherwise the
+    channel's full repodata.json.  This is run on a worker thread by
+    _fetch_live_repodata.
+
+    Parameters
+    ----------
+    chan: str
+        channel url including the subdirectory, e.g.
+        https://conda.anaconda.org/conda-forge/noarch
+
+    packages: list [ conda_lock.conda_solver.FetchAction ]
+        packages from chan to vendor
+
+    cancel: threading.Event
+        optional, stop downloading (raise DownloadCancelled) once it is set
+
+    Returns
+    -------
+    dict
+        the channel's "packages" and "packages.conda" entries for packages
+    """
+    repo_data = _download_repodata_shards(chan, packages, cancel)
+    if repo_data is not None:
+        return repo_data
+
+    url = f"{chan}/repodata.json"
+    _yellow(f"Downloading {url}")
+    return _download_repodata(url, {pkg["fn"] for pkg in packages}, cancel)
+
+
+def _fetch_live_repodata(
+    package_list: List[FetchAction], cancel: threading.Event = None
+) -> dict:
+    """Fetch the repodata of every channel in package_list concurrently,
+    keeping only the entries for the packages in package_list.
+
+    Parameters
+    ----------
+    package_list: list [ conda_lock.conda_solver.FetchAction ]
+        list of packages (and their metadata) provided by conda-lock
+
+    cancel: threading.Event
+        optional, stop downloading (raise DownloadCancelled) once it is set
+
+    Returns
+    -------
+    dict
+        mapping of channel url to the channel's (filtered) repodata
+    """
+    live_repodata = {}
+    if not package_list:
+        return live_repodata
+
+    channel_packages = {}
+    for pkg in package_list:
+        channel_packages.setdefault(pkg["channel"], []).append(pkg)
+
+    with ThreadPoolExecutor(max_workers=_DOWNLOAD_WORKERS) as executor:
+        futures = {
+            executor.submit(
+                _download_channel_repodata, chan, packages, cancel
+            ): chan
+            for chan, packages in channel_packages.items()
+        }
+
+        for future in as_completed(futures):
+            live_repodata[futures[future]] = future.result()
+
+    return live_repodata
 
 
 def _create_repodata_for_subdir(
-    subdir: str, package_list: List[FetchAction]
+    subdir: str, package_list: List[FetchAction], live_repodata: dict
 ) -> dict:
     """
     Create an in memory repodata object for the subdirectory {subdir} from the
-    list of packages supplied.  This goes out to the actual channel the
-    solution specifies and gets a copy of the channels repodata.json and uses
-    that to create the local repodata dictionary.
+    list of packages supplied.  This uses the copy of each channel's
+    repodata.json fetched by _fetch_live_repodata to create the local
+    repodata dictionary.
 
     Parameters
     ----------
@@ -355,6 +889,10 @@ def _create_repodata_for_subdir(
         list of packages to vendor.  **These packages should all satisfy the
         precondition that package["subdir"] == {subdir}**
 
+    live_repodata: dict
+        mapping of channel url to the channel's repodata, as returned by
+        _fetch_live_repodata
+
     Returns
     -------
     dictionary object that is the structured repodata
@@ -366,51 +904,31 @@ def _create_repodata_for_subdir(
         "packages.conda": {},
     }
 
-    """
-    Sometimes the "url" field in the repodata.json points to the conda-forge/linux-64
-    channel while the "channel" in the repodata.json points to conda-forge/noarch.
-    When this happens, the channel is corrected to point to conda-forge/linux-64.
-    And Vice Versa, linux-64 channels are corrected to noarch when the url field is noarch.
-    Who Da What A???? wa Conda forever.
-    """
-    linux_channel = 'https://conda.anaconda.org/conda-forge/linux-64'
-    noarch_channel = 'https://conda.anaconda.org/conda-forge/noarch'
-
+    channels = {}
     for pkg in package_list:
-        if linux_channel in pkg['url'] and noarch_channel in pkg['channel']:
-            pkg['channel'] = linux_channel  
-            continue
-        if noarch_channel in pkg['url'] and linux_channel in pkg['channel']:
-            pkg['channel'] = noarch_channel     
+        channels.setdefault(pkg["channel"], []).append(pkg)
 
-    channels = list(set((pkg["channel"] for pkg in package_list)))
-    for chan in channels:
-        channel_packages = [
-            pkg for pkg in package_list if pkg["channel"] == chan
-        ]
-        
+    for chan, channel_packages in channels.items():
         url = f"{chan}/repodata.json"
-        _yellow(f"Downloading {url}")
-
-        live_repodata_json = _improved_download(url).json()
+        live_repodata_json = live_repodata[chan]
         _live_pkgs = live_repodata_json.get("packages", {})
         _live_pkgs_conda = live_repodata_json.get("packages.conda", {})
 
-        label = url if len(url) < 30 else f"...{url[-30:]}"
-        with click.progressbar(channel_packages, label=label) as packages:
-            for pkg in packages:
-                _live_repodata = _live_pkgs.get(pkg["fn"])
-                if _live_repodata:
-                    assert repo_data["packages"].get(pkg["fn"]) is None
-                    repo_data["packages"][pkg["fn"]] = _live_repodata
-                    continue
-
-                _live_repodata = _live_pkgs_conda.get(pkg["fn"])
-                if _live_repodata:
-                    assert repo_data["packages.conda"].get(pkg["fn"]) is None
-                    repo_data["packages.conda"][pkg["fn"]] = _live_repodata
-                    continue
+        # set intersections (done in C) rather than a lookup per package
+        fns = {pkg["fn"] for pkg in channel_packages}
+        hits = _live_pkgs.keys() & fns
+        hits_conda = (_live_pkgs_conda.keys() & fns) - hits
 
+        assert not repo_data["packages"].keys() & hits
+        repo_data["packages"].update({fn: _live_pkgs[fn] for fn in hits})
+        assert not repo_data["packages.conda"].keys() & hits_conda
+        repo_data["packages.conda"].update(
+            {fn: _live_pkgs_conda[fn] for fn in hits_conda}
+        )
+
+        missing = fns - hits - hits_conda
+        for pkg in channel_packages:
+            if pkg["fn"] in missing:
                 _red(f"unable to find package {pkg['fn']} at {url}")
                 _red(pkg)
                 sys.exit(1)
@@ -418,13 +936,39 @@ def _create_repodata_for_subdir(
     return repo_data
 
 
+def _print_package_listing(package_list: List[FetchAction]):
+    """print the channel, url, checksum, ... of every package in
+    package_list"""
+    _blue(70 * "=")
+    # format the whole listing up front and write it with a single echo
+    # rather than styling and flushing every line separately
+    if package_list:
+        _yellow(
+            "\n".join(
+                f"Channel: {pkg['channel']}\n"
+                f"Package: {pkg['fn']}\n"
+                f"URL: {pkg['url']}\n"
+                f"SHA256: {pkg['sha256']}\n"
+                f"Subdirectory: {pkg['subdir']}\n"
+                f"Timestamp: {pkg['timestamp']}\n"
+                for pkg in package_list
+            ),
+            bold=False,
+        )
+    _blue(70 * "=")
+
+
 def create_repodata_json(
-    package_list: List[FetchAction], vendored_root: Path, platform: str
+    package_list: List[FetchAction],
+    vendored_root: Path,
+    platform: str,
+    list_packages: bool = True,
+    cancel: threading.Event = None,
 ):
     """Go through the package_list, i.e. the solution provided by conda_lock,
-    and generate a new repodata.json at vendored_root/{subdir}, where
-    subdir is either noarch or the platform (as specified in the metadata
-    in package_list).
+    and generate a new repodata.json (and a compressed repodata.json.zst)
+    at vendored_root/{subdir}, where subdir is either noarch or the platform
+    (as specified in the metadata in package_list).
 
     Parameters
     ----------
@@ -436,45 +980,155 @@ def create_repodata_json(
 
     platform: str
         platform to vendor
+
+    list_packages: bool
+        print the package listing (see _print_package_listing) first
+
+    cancel: threading.Event
+        optional, stop downloading (raise DownloadCancelled) once it is set
     """
     assert isinstance(vendored_root, Path)
 
-    subdirs = [platform, "noarch"]
+    subdirs = {platform, "noarch"} | {pkg["subdir"] for pkg in package_list}
 
-    _blue(70 * "=")
-    for pkg in package_list:
-        subdirs.append(pkg["subdir"])
-
-        _yellow(f"Channel: {pkg['channel']}", bold=False)
-        _yellow(f"Package: {pkg['fn']}", bold=False)
-        _yellow(f"URL: {pkg['url']}", bold=False)
-        _yellow(f"SHA256: {pkg['sha256']}", bold=False)
-        _yellow(f"Subdirectory: {pkg['subdir']}", bold=False)
-        _yellow(f"Timestamp: {pkg['timestamp']}", bold=False)
-        click.echo()
+    if list_packages:
+        _print_package_listing(package_list)
 
-    _blue(70 * "=")
+    # fetch the repodata of every channel (across all subdirs) up front so
+    # the downloads run concurrently
+    _correct_channels(package_list)
+    live_repodata = _fetch_live_repodata(package_list, cancel)
 
-    subdirs = list(set(subdirs))
     for subdir in subdirs:
         repo_data = _create_repodata_for_subdir(
             subdir,
             [pkg for pkg in package_list if pkg["subdir"] == subdir],
+            live_repodata,
+        )
+        # write to destination, along with the zstd compressed copy newer
+        # versions of conda prefer
+        payload = orjson.dumps(repo_data)
+        dest_dir = vendored_root / subdir
+        (dest_dir / "repodata.json").write_bytes(payload)
+        (dest_dir / "repodata.json.zst").write_bytes(
+            zstandard.ZstdCompressor(level=3, threads=-1).compress(payload)
         )
-        # write to destination
-        dest_file = vendored_root / subdir / "repodata.json"
-        with dest_file.open("w") as f:
-            json.dump(repo_data, f)
 
     _blue(70 * "=")
 
 
-# TODO: download and checksum in chunks
-# https://stackoverflow.com/questions/16694907/download-large-file-in-python-with-requests
-def download_packages(package_list: List[FetchAction], vendored_root: Path):
+def _sha256():
+    """Create a sha256 hash object.  The checksum is only used to verify
+    the integrity of the downloads, so skip the extra FIPS bookkeeping when
+    the Python version supports it (3.9+).
+    """
+    try:
+        return hashlib.new("sha256", usedforsecurity=False)
+    except TypeError:
+        return hashlib.sha256()
+
+
+def _is_sha256(checksum) -> bool:
+    """check that checksum is a hex encoded sha256 (and safe to use as a
+    file name)"""
+    return isinstance(checksum, str) and re.fullmatch(
+        "[0-9a-f]{64}", checksum
+    ) is not None
+
+
+def _link_or_copy(src: Path, dest: Path):
+    """hard link src to dest, copy it if they are on different file
+    systems (or the file system doesn't support hard links)"""
+    try:
+        os.link(src, dest)
+    except OSError:
+        copyfile(src, dest)
+
+
+# see https://stackoverflow.com/questions/16694907/download-large-file-in-python-with-requests
+def _download_package(
+    pkg: FetchAction, vendored_root: Path, cancel: threading.Event = None
+):
+    """Fetch the binary for a single package, verify its checksum and write
+    it to vendored_root/{subdir}.  This is run on a worker thread by
+    download_packages.
+
+    Verified packages are kept in the on disk cache, named after their
+    sha256, and linked into vendored_root.  If the package is already in
+    the cache it isn't downloaded again.  Otherwise the package is streamed
+    in _CHUNK_SIZE chunks into the cache, each chunk is hashed and written
+    as it arrives so the whole file is never held in memory.  Raises
+    ChecksumError if the checksum doesn't match, nothing is written to the
+    cache or vendored_root in that case.
+
+    Parameters
+    ----------
+    pkg: conda_lock.conda_solver.FetchAction
+        package (and its metadata) provided by conda-lock
+
+    vendored_root: pathlib.Path
+        location of the root of the new conda channel
+
+    cancel: threading.Event
+        optional, stop downloading (raise DownloadCancelled) once it is set
+    """
+    dest_dir = vendored_root / pkg["subdir"]
+    assert dest_dir.exists() and dest_dir.is_dir()
+    dest = dest_dir / pkg["fn"]
+
+    if not _is_sha256(pkg["sha256"]):
+        raise ChecksumError(pkg)
+
+    cached = _get_cache_dir() / "blobs" / pkg["sha256"][:2] / pkg["sha256"]
+    if cached.exists():
+        _link_or_copy(cached, dest)
+        return
+    cached.parent.mkdir(parents=True, exist_ok=True)
+
+    _check_cancelled(cancel)
+
+    response = _improved_download(pkg["url"], stream=True)
+    with response:
+        if response.status_code >= 400:
+            _red(f"Download Failed for {pkg['url']}")
+            _red(f"server responded: {response.status_code}")
+            sys.exit(1)
+
+        # download to a temporary file and only move it into the cache once
+        # it is verified, concurrent runs never see a partial package
+        f = tempfile.NamedTemporaryFile(dir=cached.parent, delete=False)
+        sha256 = _sha256()
+        try:
+            with f:
+                for chunk in response.iter_content(chunk_size=_CHUNK_SIZE):
+                    _check_cancelled(cancel)
+                    sha256.update(chunk)
+                    f.write(chunk)
+
+            # verify checksum
+            if not hmac.compare_digest(sha256.hexdigest(), pkg["sha256"]):
+                raise ChecksumError(pkg)
+            # the blob is linked into the channel, which is served or
+            # copied into images and has to be readable by other users
+            os.chmod(f.name, 0o666 & ~_UMASK)
+            os.replace(f.name, cached)
+        except BaseException:
+            os.unlink(f.name)
+            raise
+
+    _link_or_copy(cached, dest)
+
+
+def download_packages(
+    package_list: List[FetchAction],
+    vendored_root: Path,
+    cancel: threading.Event = None,
+):
     """For each Conda package specified in package_list.  Fetch the binary
     from the url (in the metadata).  Calculate the checksum and verify
-    it with the provided checksum.
+    it with the provided checksum.  Packages are downloaded concurrently
+    on _DOWNLOAD_WORKERS threads, packages in the on disk cache from a
+    previous run are reused.
 
     Parameters
     ----------
@@ -483,30 +1137,39 @@ def download_packages(package_list: List[FetchAction], vendored_root: Path):
 
     vendored_root: pathlib.Path
         location of the root of the new conda channel
+
+    cancel: threading.Event
+        optional, stop downloading (raise DownloadCancelled) once it is
+        set.  It is set when a download fails
     """
     assert isinstance(vendored_root, Path)
+    if cancel is None:
+        cancel = threading.Event()
     _green("Downloading and Verifying SHA256 Checksums for Solved Packages")
 
-    with click.progressbar(
-        package_list, label="Downloading Progress"
-    ) as pkgs:
-        for pkg in pkgs:
-            dest_dir = vendored_root / pkg["subdir"]
-            assert dest_dir.exists() and dest_dir.is_dir()
-
-            response = _improved_download(pkg["url"])
-            if response.status_code >= 400:
-                _red(f"Download Failed for {pkg['url']}")
-                _red(f"server responded: {response.status_code}")
-                sys.exit(1)
-            file_data = response.content
-            # verify checksum
-            sha256 = hashlib.sha256(file_data).hexdigest()
-            if sha256 != pkg["sha256"]:
-                _red(f"SHA256 Checksum Validation Failed for {pkg['fn']}")
+    with ThreadPoolExecutor(max_workers=_DOWNLOAD_WORKERS) as executor:
+        futures = [
+            executor.submit(_download_package, pkg, vendored_root, cancel)
+            for pkg in package_list
+        ]
+        with click.progressbar(
+            length=len(futures), label="Downloading Progress"
+        ) as pb:
+            try:
+                for future in as_completed(futures):
+                    # re-raises the SystemExit from a failed download
+                    future.result()
+                    pb.update(1)
+            except ChecksumError as e:
+                _red(str(e))
                 sys.exit(1)
-            with open(dest_dir / pkg["fn"], "wb") as f:
-                f.write(file_data)
+            finally:
+                # after a failure don't start the downloads still queued and
+                # stop the ones still running
+                if not all(future.done() for future in futures):
+                    cancel.set()
+                for future in futures:
+                    future.cancel()
 
 
 def yaml_dump_ironbank_manifest(package_list: List[FetchAction]):
@@ -536,9 +1199,14 @@ def yaml_dump_ironbank_manifest(package_list: List[FetchAction]):
 
         resources["resources"].append(resource)
 
-    yaml_ = YAML()
     with open("ib_manifest.yaml", "w") as f:
-        yaml_.dump(resources, f)
+        yaml.dump(
+            resources,
+            f,
+            Dumper=_YAML_DUMPER,
+            sort_keys=False,
+            default_flow_style=False,
+        )
     _green("Iron Bank resources list written to ib_manifest.yaml")
 
 
@@ -557,6 +1225,7 @@ def main() -> None:
 
 
 # see https://github.com/conda/conda/blob/248741a843e8ce9283fa94e6e4ec9c2fafeb76fd/conda/base/context.py#L51
+@lru_cache(maxsize=None)
 def _get_conda_platform(platform=None) -> str:
     """Get the platform string (the string Conda needs) but allow the
     caller to override.
@@ -573,7 +1242,7 @@ def _get_conda_platform(platform=None) -> str:
         return platform
 
     platform = sys.platform
-    bits = struct.calcsize("P") * 8
+    bits = sys.maxsize.bit_length() + 1
 
     _platform_map = {
         "linux2": "linux",
@@ -600,6 +1269,7 @@ def _get_system_virtual_packages(solver: str) -> List[dict]:
         a list of virtual packages as a dictionary having keys name, version,
         and build_string
     """
+    from conda_lock.invoke_conda import is_micromamba
 
     conda_info = check_output(split(f"{solver} info --json"), text=True)
     _json = json.loads(conda_info)
@@ -655,7 +1325,7 @@ def _validate_solver(solver: str):
 @click.option(
     "-p",
     "--platform",
-    default=_get_conda_platform(),
+    default=_get_conda_platform,
     help="Platform to solve for.",
 )
 @click.option(
@@ -745,8 +1415,46 @@ def vendor(
         click.echo(json.dumps(package_list, indent=4))
         sys.exit(0)
 
-    create_repodata_json(package_list, vendored_root, platform)
-    download_packages(package_list, vendored_root)
+    # the repodata and the packages are independent, build the repodata on
+    # a background thread while the packages download.  Its output is
+    # written after the download progress bar is done.  If either side
+    # fails the other one is cancelled and vendor exits right away
+    _print_package_listing(package_list)
+    cancel = threading.Event()
+    repodata_errors = []
+
+    def _create_repodata():
+        try:
+            create_repodata_json(
+                package_list,
+                vendored_root,
+                platform,
+                list_packages=False,
+                cancel=cancel,
+            )
+        except DownloadCancelled:
+            # the packages failed to download, that error is reported
+            pass
+        except BaseException as e:
+            # e.g. the SystemExit from a failed download
+            repodata_errors.append(e)
+            cancel.set()
+
+    # a daemon thread, exiting doesn't wait for it after a failed download
+    repodata = threading.Thread(target=_create_repodata, daemon=True)
+    with _defer_background_output():
+        repodata.start()
+        try:
+            download_packages(package_list, vendored_root, cancel=cancel)
+        except DownloadCancelled:
+            # the repodata failed, its error is raised below
+            pass
+        except BaseException:
+            cancel.set()
+            raise
+        repodata.join()
+    if repodata_errors:
+        raise repodata_errors[0]
 
     _green("SHA256 Checksum Validation and Packages Downloaded")
     _green("Vendoring Complete!")
@@ -777,7 +1485,7 @@ def vendor(
 @click.option(
     "--platform",
     "-p",
-    default=_get_conda_platform(),
+    default=_get_conda_platform,
     help="Platform to solve for.",
 )
 @click.option(
@@ -848,9 +1556,13 @@ def virtual_packages(solver, output):
 
     if output:
         with open(output, "w") as f:
-            yaml.dump(virtual_packages_dict, f, indent=4)
+            yaml.dump(
+                virtual_packages_dict, f, Dumper=_YAML_DUMPER, indent=4
+            )
     else:
-        yaml.dump(virtual_packages_dict, sys.stdout, indent=4)
+        yaml.dump(
+            virtual_packages_dict, sys.stdout, Dumper=_YAML_DUMPER, indent=4
+        )
 
 
 main.add_command(vendor)
@@ -27,12 +27,16 @@ setup(
     },
     install_requires=[
         "click",
+        "ijson",
+        "msgpack",
+        "orjson",
         "conda-lock==1.4.0",
         "packaging",
+        "platformdirs",
         "requests",
-        "ruamel.yaml",
         "setuptools>=43",
         "pyyaml",
+        "zstandard",
     ],
     setup_requires=["setuptools>=43", "wheel"],
     python_requires=">=3.7",
@@ -0,0 +1,22 @@
+import pytest
+
+from conda_vendor.conda_vendor import _get_conda_platform
+
+
+# keep the tests from reading or writing the user's conda-vendor cache
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path_factory, monkeypatch):
+    d = tmp_path_factory.mktemp("cache")
+    monkeypatch.setattr(
+        "conda_vendor.conda_vendor._get_cache_dir", lambda: d
+    )
+    return d
+
+
+# _get_conda_platform is cached, make sure every test detects the platform
+@pytest.fixture(autouse=True)
+def clear_conda_platform_cache():
+    _get_conda_platform.cache_clear()
+    yield
+    _get_conda_platform.cache_clear()
+
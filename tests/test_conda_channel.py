@@ -1,7 +1,7 @@
 from unittest.mock import Mock, patch
 from requests import Response
 
-from conda_vendor.conda_vendor import _improved_download
+from conda_vendor.conda_vendor import _get_session, _improved_download
 
 
 @patch("requests.Session.get")
@@ -13,3 +13,7 @@ def test_improved_download(mock) -> None:
     assert result_called_with == test_url
     assert mock.call_count == 1
     assert isinstance(result, Response)
+
+
+def test_session_reused() -> None:
+    assert _get_session() is _get_session()
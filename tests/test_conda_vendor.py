@@ -1,17 +1,25 @@
 import conda_lock
 import hashlib
+import io
 import json
+import msgpack
 import os
 import pytest
+import subprocess
+import sys
+import threading
+import time
 import yaml
+import zstandard
 
+from click.testing import CliRunner
 from contextlib import contextmanager
 from copy import deepcopy
 from importlib import resources
 from pathlib import Path
 from requests import Response
 from requests.exceptions import ConnectionError
-from unittest.mock import patch
+from unittest.mock import ANY, patch
 
 from conda_lock.conda_solver import (
     _reconstruct_fetch_actions as reconstruct_fetch_actions,
@@ -31,33 +39,53 @@ from conda_vendor.conda_vendor import (
     create_repodata_json,
     download_packages,
     solve_environment,
+    vendor,
     yaml_dump_ironbank_manifest,
 )
 
 
+#####################################################################
+# conda-lock and requests are imported lazily
+#####################################################################
+
+
+def test_lazy_imports():
+    code = (
+        "import sys, conda_vendor.conda_vendor; "
+        "print(','.join(m for m in ('conda_lock', 'requests') "
+        "if m in sys.modules))"
+    )
+    out = subprocess.check_output([sys.executable, "-c", code], text=True)
+    assert out.strip() == ""
+
+
 #####################################################################
 # Verify _get_conda_platform()
 #####################################################################
 
 
 @patch("sys.platform", "linux")
-@patch("struct.calcsize")
-def test_get_conda_platform_32bit(mock_struct) -> None:
-    mock_struct.return_value = 4
+@patch("sys.maxsize", 2**31 - 1)
+def test_get_conda_platform_32bit() -> None:
     expected = "linux-32"
     result = _get_conda_platform()
     assert expected == result
-    assert mock_struct.call_count == 1
 
 
 @patch("sys.platform", "darwin")
-@patch("struct.calcsize")
-def test_get_conda_platform_64bi(mock_struct) -> None:
-    mock_struct.return_value = 8
+@patch("sys.maxsize", 2**63 - 1)
+def test_get_conda_platform_64bi() -> None:
     expected = "osx-64"
     result = _get_conda_platform()
     assert expected == result
-    assert mock_struct.call_count == 1
+
+
+@patch("sys.platform", "linux")
+@patch("sys.maxsize", 2**63 - 1)
+def test_get_conda_platform_cached() -> None:
+    assert _get_conda_platform() == "linux-64"
+    with patch("sys.platform", "darwin"):
+        assert _get_conda_platform() == "linux-64"
 
 
 def test_get_conda_platform_passthrough():
@@ -75,16 +103,16 @@ def test_get_conda_platform_passthrough():
 #####################################################################
 
 
-@patch("conda_vendor.conda_vendor.conda_lock_version", "1.2.1")
-@patch("conda_vendor.conda_vendor.parse_environment_file")
+@patch("conda_vendor.conda_vendor._PARSE_ENV_NEEDS_PLATFORM", False)
+@patch("conda_lock.src_parser.environment_yaml.parse_environment_file")
 def test_parse_environment_file_v121(mock_parse_environment_file):
     mock_parse_environment_file.return_value = True
     _generate_lock_spec("test.yml", "linux-64")
     assert len(mock_parse_environment_file.call_args.args) == 1
 
 
-@patch("conda_vendor.conda_vendor.conda_lock_version", "1.3.0")
-@patch("conda_vendor.conda_vendor.parse_environment_file")
+@patch("conda_vendor.conda_vendor._PARSE_ENV_NEEDS_PLATFORM", True)
+@patch("conda_lock.src_parser.environment_yaml.parse_environment_file")
 def test_parse_environment_file_v130(mock_parse_environment_file):
     mock_parse_environment_file.return_value = True
     _generate_lock_spec("test.yml", "linux-64")
@@ -110,19 +138,34 @@ dependencies:
     assert name == "readme"
 
 
+# the parsed environment.yaml is reused until the file changes
+def test_get_environment_name_modified(tmp_path_factory):
+    f = tmp_path_factory.mktemp("test") / "env.yml"
+    f.write_text("name: before\n")
+    os.utime(f, ns=(0, 0))
+    assert _get_environment_name(f) == "before"
+
+    f.write_text("name: after\n")
+    os.utime(f, ns=(0, 0))
+    assert _get_environment_name(f) == "before"
+
+    os.utime(f, ns=(1, 1))
+    assert _get_environment_name(f) == "after"
+
+
 #####################################################################
 # test _get_virtual_packages
 #####################################################################
 
 
-@patch("conda_vendor.conda_vendor.default_virtual_package_repodata")
+@patch("conda_lock.virtual_package.default_virtual_package_repodata")
 def test_get_virtual_packages_default(mock_default_virtual_package_repodata):
     mock_default_virtual_package_repodata.return_value = True
     p = _get_virtual_packages("fake-64")
     mock_default_virtual_package_repodata.assert_called_once()
 
 
-@patch("conda_vendor.conda_vendor.virtual_package_repo_from_specification")
+@patch("conda_lock.virtual_package.virtual_package_repo_from_specification")
 def test_get_virtual_packages_str(mock_virtual_package_repodata_from_spec):
     mock_virtual_package_repodata_from_spec.return_value = True
     p = _get_virtual_packages("fake-64", "test.yml")
@@ -131,7 +174,7 @@ def test_get_virtual_packages_str(mock_virtual_package_repodata_from_spec):
     assert isinstance(args[0], Path)
 
 
-@patch("conda_vendor.conda_vendor.virtual_package_repo_from_specification")
+@patch("conda_lock.virtual_package.virtual_package_repo_from_specification")
 def test_get_virtual_packages_path(mock_virtual_package_repodata_from_spec):
     mock_virtual_package_repodata_from_spec.return_value = True
     p = _get_virtual_packages("fake-64", Path("test.yml"))
@@ -210,6 +253,14 @@ def download_root(tmp_path_factory):
     return f
 
 
+def _make_response(status_code: int, data: bytes) -> Response:
+    """build a Response whose body can be streamed with iter_content"""
+    response = Response()
+    response.status_code = status_code
+    response.raw = io.BytesIO(data)
+    return response
+
+
 @patch("conda_vendor.conda_vendor._improved_download")
 def test_remove_channel_download(
     mock_improved_download, download_root, pytorch_solution
@@ -222,13 +273,9 @@ def test_remove_channel_download(
     for pkg in solution:
         pkg["sha256"] = file_sha
 
-    response = Response()
-    response._content = bytes(file_data, encoding="utf-8")
-    response.status_code = 200
-
-    def _mock_download(url):
+    def _mock_download(url, **kwargs):
         assert url != chan
-        return response
+        return _make_response(200, bytes(file_data, encoding="utf-8"))
 
     mock_improved_download.side_effect = _mock_download
     download_packages(solution, download_root)
@@ -310,7 +357,7 @@ def _create_repodata_record_json():
 # on _remove_channel being the final call before reconstruct_fetch_actions
 # so that we can give reconstruct_fetch_actions the data we want it to have
 @patch("conda_vendor.conda_vendor._remove_channel")
-@patch("conda_vendor.conda_vendor.solve_specs_for_arch")
+@patch("conda_lock.conda_solver.solve_specs_for_arch")
 def test_reconstruct_fetch_actions(
     mock_solve_specs_for_arch,
     mock_remove_channel,
@@ -365,13 +412,16 @@ def create_repodata_input():
 @pytest.fixture
 def create_repodata_output():
     inp = resources.files("tests.resources") / "create_repodata_output.json"
-    with open(inp, "r") as f:
+    with open(inp, "rb") as f:
         data = f.read()
 
-    response = Response()
-    response.status_code = 200
-    response._content = bytes(data, encoding="utf-8")
-    return response
+    # these channels don't provide sharded repodata
+    def _mock_download(url, **kwargs):
+        if not url.endswith("repodata.json"):
+            return _make_response(404, b"")
+        return _make_response(200, data)
+
+    return _mock_download
 
 
 @patch("conda_vendor.conda_vendor._improved_download")
@@ -382,7 +432,7 @@ def test_create_repodata_json(
     download_root,
 ):
 
-    mock_download.return_value = create_repodata_output
+    mock_download.side_effect = create_repodata_output
     create_repodata_json(
         create_repodata_input["FETCH"], download_root, "linux-64"
     )
@@ -400,19 +450,271 @@ def test_create_repodata_json(
         assert pkg["name"] in repodata_packages
 
 
+# only the vendored packages are kept from the channel's repodata.json
+@patch("conda_vendor.conda_vendor._improved_download")
+def test_create_repodata_json_filtered(
+    mock_download,
+    create_repodata_input,
+    create_repodata_output,
+    download_root,
+):
+
+    mock_download.side_effect = create_repodata_output
+    create_repodata_json(
+        create_repodata_input["FETCH"], download_root, "linux-64"
+    )
+
+    with open(download_root / "linux-64" / "repodata.json", "r") as f:
+        repodata = json.load(f)
+
+    expected = set(pkg["fn"] for pkg in create_repodata_input["FETCH"])
+    actual = set(repodata["packages"]) | set(repodata["packages.conda"])
+    assert expected == actual
+
+
+# a package missing from the channel's repodata.json is an error
+@patch("conda_vendor.conda_vendor._improved_download")
+def test_create_repodata_json_missing(
+    mock_download,
+    create_repodata_input,
+    create_repodata_output,
+    download_root,
+):
+
+    packages = create_repodata_input["FETCH"]
+    packages.append(dict(packages[0], fn="not-in-repodata-0-0.tar.bz2"))
+
+    mock_download.side_effect = create_repodata_output
+    with pytest.raises(SystemExit) as e:
+        create_repodata_json(packages, download_root, "linux-64")
+    assert e.value.code == 1
+
+
+# each channel's repodata.json is only fetched once, even across subdirs
+@patch("conda_vendor.conda_vendor._improved_download")
+def test_create_repodata_json_fetch_once(
+    mock_download,
+    create_repodata_input,
+    create_repodata_output,
+    download_root,
+):
+
+    mock_download.side_effect = create_repodata_output
+    create_repodata_json(
+        create_repodata_input["FETCH"], download_root, "linux-64"
+    )
+
+    urls = [
+        c.args[0]
+        for c in mock_download.call_args_list
+        if c.args[0].endswith("repodata.json")
+    ]
+    expected = set(
+        f"{pkg['channel']}/repodata.json"
+        for pkg in create_repodata_input["FETCH"]
+    )
+    assert len(urls) == len(set(urls))
+    assert set(urls) == expected
+
+
+# a second run sends the cached ETag and reuses the cache on a 304
+@patch("conda_vendor.conda_vendor._improved_download")
+def test_create_repodata_json_not_modified(
+    mock_download,
+    create_repodata_input,
+    create_repodata_output,
+    download_root,
+):
+
+    etag = '"fake-etag"'
+
+    def _mock_download(url, **kwargs):
+        response = create_repodata_output(url, **kwargs)
+        response.headers["ETag"] = etag
+        return response
+
+    mock_download.side_effect = _mock_download
+    create_repodata_json(
+        create_repodata_input["FETCH"], download_root, "linux-64"
+    )
+    dest = download_root / "linux-64" / "repodata.json"
+    first = dest.read_bytes()
+    dest.unlink()
+
+    def _mock_not_modified(url, **kwargs):
+        if not url.endswith("repodata.json"):
+            return _make_response(404, b"")
+        assert kwargs["headers"]["If-None-Match"] == etag
+        return _make_response(304, b"")
+
+    mock_download.side_effect = _mock_not_modified
+    create_repodata_json(
+        create_repodata_input["FETCH"], download_root, "linux-64"
+    )
+    assert dest.read_bytes() == first
+
+
+def _msgpack_zst(obj) -> bytes:
+    return zstandard.ZstdCompressor().compress(msgpack.packb(obj))
+
+
+@pytest.fixture
+def repodata_shards():
+    inp = resources.files("tests.resources") / "create_repodata_output.json"
+    with open(inp, "r") as f:
+        live = json.load(f)
+
+    by_name = {}
+    for key in ("packages", "packages.conda"):
+        for fn, entry in live[key].items():
+            shard = by_name.setdefault(
+                entry["name"], {"packages": {}, "packages.conda": {}}
+            )
+            shard[key][fn] = dict(
+                entry, sha256=bytes.fromhex(entry["sha256"])
+            )
+
+    # shards are named after the sha256 of their (compressed) content
+    index = {"info": {"shards_base_url": "./shards/"}, "shards": {}}
+    shards = {}
+    for name, shard in by_name.items():
+        data = _msgpack_zst(shard)
+        h = hashlib.sha256(data).digest()
+        index["shards"][name] = h
+        shards[h.hex()] = data
+
+    return live, index, shards
+
+
+# only the shards for the vendored packages are fetched when the channel
+# provides sharded repodata
+@patch("conda_vendor.conda_vendor._improved_download")
+def test_create_repodata_json_shards(
+    mock_download,
+    create_repodata_input,
+    download_root,
+    repodata_shards,
+):
+    packages = create_repodata_input["FETCH"]
+    live, index, shards = repodata_shards
+
+    def _mock_download(url, **kwargs):
+        assert not url.endswith("repodata.json")
+        if url.endswith("repodata_shards.msgpack.zst"):
+            return _make_response(200, _msgpack_zst(index))
+        name = url.rsplit("/", 1)[-1].split(".")[0]
+        assert "/shards/" in url and name in shards
+        return _make_response(200, shards[name])
+
+    mock_download.side_effect = _mock_download
+    create_repodata_json(packages, download_root, "linux-64")
+
+    with open(download_root / "linux-64" / "repodata.json", "r") as f:
+        repodata = json.load(f)
+
+    for pkg in packages:
+        key = "packages"
+        if pkg["fn"] in live["packages.conda"]:
+            key = "packages.conda"
+        assert repodata[key][pkg["fn"]] == live[key][pkg["fn"]]
+
+    # one shard index and one shard per vendored package
+    assert mock_download.call_count == 1 + len(
+        set(pkg["name"] for pkg in packages)
+    )
+
+
+# a shard that doesn't match its sha256 isn't cached, the full
+# repodata.json is used instead
+@patch("conda_vendor.conda_vendor._improved_download")
+def test_create_repodata_json_shards_corrupted(
+    mock_download,
+    create_repodata_input,
+    create_repodata_output,
+    download_root,
+    repodata_shards,
+    cache_dir,
+):
+    packages = create_repodata_input["FETCH"]
+    _, index, shards = repodata_shards
+
+    def _mock_download(url, **kwargs):
+        if url.endswith("repodata_shards.msgpack.zst"):
+            return _make_response(200, _msgpack_zst(index))
+        if "/shards/" in url:
+            return _make_response(200, b"corrupted")
+        return create_repodata_output(url, **kwargs)
+
+    mock_download.side_effect = _mock_download
+    create_repodata_json(packages, download_root, "linux-64")
+
+    assert (download_root / "linux-64" / "repodata.json").exists()
+    assert not list((cache_dir / "shards").iterdir())
+
+
+# a connection error on the (optional) shard index falls back to the full
+# repodata.json
+@patch("conda_vendor.conda_vendor._improved_download")
+def test_create_repodata_json_shard_index_error(
+    mock_download,
+    create_repodata_input,
+    create_repodata_output,
+    download_root,
+):
+    def _mock_download(url, **kwargs):
+        if url.endswith("repodata_shards.msgpack.zst"):
+            raise ConnectionError()
+        return create_repodata_output(url, **kwargs)
+
+    mock_download.side_effect = _mock_download
+    create_repodata_json(
+        create_repodata_input["FETCH"], download_root, "linux-64"
+    )
+
+    with open(download_root / "linux-64" / "repodata.json", "r") as f:
+        repodata = json.load(f)
+    fns = repodata["packages"].keys() | repodata["packages.conda"].keys()
+    for pkg in create_repodata_input["FETCH"]:
+        if pkg["subdir"] == "linux-64":
+            assert pkg["fn"] in fns
+
+
 @patch("conda_vendor.conda_vendor._improved_download")
 def test_create_repodata_json_both_subdir_empty(
     mock_download,
     create_repodata_output,
     download_root,
 ):
-    mock_download.return_value = create_repodata_output
+    mock_download.side_effect = create_repodata_output
     create_repodata_json([], download_root, "linux-64")
 
     assert (download_root / "linux-64" / "repodata.json").exists()
     assert (download_root / "noarch" / "repodata.json").exists()
 
 
+# the compressed repodata.json.zst matches the repodata.json
+@patch("conda_vendor.conda_vendor._improved_download")
+def test_create_repodata_json_zst(
+    mock_download,
+    create_repodata_input,
+    create_repodata_output,
+    download_root,
+):
+
+    mock_download.side_effect = create_repodata_output
+    create_repodata_json(
+        create_repodata_input["FETCH"], download_root, "linux-64"
+    )
+
+    for subdir in ("linux-64", "noarch"):
+        dest = download_root / subdir
+        compressed = (dest / "repodata.json.zst").read_bytes()
+        decompressor = zstandard.ZstdDecompressor().decompressobj()
+        assert decompressor.decompress(compressed) == (
+            dest / "repodata.json"
+        ).read_bytes()
+
+
 @patch("conda_vendor.conda_vendor._improved_download")
 def test_create_repodata_json_noarch_subdir_empty(
     mock_download,
@@ -421,7 +723,7 @@ def test_create_repodata_json_noarch_subdir_empty(
     download_root,
 ):
 
-    mock_download.return_value = create_repodata_output
+    mock_download.side_effect = create_repodata_output
     create_repodata_json(
         create_repodata_input["FETCH"], download_root, "linux-64"
     )
@@ -482,11 +784,8 @@ def test_download_packages(
     packages = download_package_lists["packages"]
     data = download_package_lists["data"]
 
-    def _mock_download(url):
-        response = Response()
-        response.status_code = 200
-        response._content = data[url]
-        return response
+    def _mock_download(url, **kwargs):
+        return _make_response(200, data[url])
 
     mock_download.side_effect = _mock_download
     download_packages(packages, download_root)
@@ -503,6 +802,80 @@ def test_download_packages(
             assert h == pkg["sha256"]
 
 
+# the vendored packages get the same mode a plain open() gives a new file
+@patch("conda_vendor.conda_vendor._improved_download")
+def test_download_packages_mode(
+    mock_download, download_package_lists, download_root
+):
+    packages = download_package_lists["packages"]
+    data = download_package_lists["data"]
+
+    def _mock_download(url, **kwargs):
+        return _make_response(200, data[url])
+
+    mock_download.side_effect = _mock_download
+    download_packages(packages, download_root)
+
+    expected = download_root / "expected"
+    expected.write_bytes(b"")
+    for pkg in packages:
+        loc = download_root / "linux-64" / pkg["fn"]
+        assert loc.stat().st_mode == expected.stat().st_mode
+
+
+# verified packages are cached and reused by later runs
+@patch("conda_vendor.conda_vendor._improved_download")
+def test_download_packages_cached(
+    mock_download, download_package_lists, tmp_path_factory
+):
+
+    packages = download_package_lists["packages"]
+    data = download_package_lists["data"]
+
+    def _mock_download(url, **kwargs):
+        return _make_response(200, data[url])
+
+    roots = []
+    for _ in range(2):
+        root = tmp_path_factory.mktemp("downloads")
+        Path.mkdir(root / "linux-64")
+        roots.append(root)
+
+    mock_download.side_effect = _mock_download
+    download_packages(packages, roots[0])
+    assert mock_download.call_count == len(packages)
+
+    mock_download.side_effect = ConnectionError()
+    download_packages(packages, roots[1])
+    assert mock_download.call_count == len(packages)
+
+    for pkg in packages:
+        loc = roots[1] / "linux-64" / pkg["fn"]
+        assert loc.read_bytes() == data[pkg["url"]]
+
+
+# packages larger than a single chunk are hashed and written incrementally
+@patch("conda_vendor.conda_vendor._CHUNK_SIZE", 4)
+@patch("conda_vendor.conda_vendor._improved_download")
+def test_download_packages_chunked(
+    mock_download, download_package_lists, download_root
+):
+
+    packages = download_package_lists["packages"]
+    data = download_package_lists["data"]
+
+    def _mock_download(url, **kwargs):
+        assert kwargs.get("stream")
+        return _make_response(200, data[url])
+
+    mock_download.side_effect = _mock_download
+    download_packages(packages, download_root)
+
+    for pkg in packages:
+        loc = download_root / "linux-64" / pkg["fn"]
+        assert loc.read_bytes() == data[pkg["url"]]
+
+
 @patch("conda_vendor.conda_vendor._improved_download")
 def test_download_packages_bad_sha(
     mock_download, download_package_lists, download_root
@@ -513,11 +886,8 @@ def test_download_packages_bad_sha(
 
     packages[0]["sha256"] = ""
 
-    def _mock_download(url):
-        response = Response()
-        response.status_code = 200
-        response._content = data[url]
-        return response
+    def _mock_download(url, **kwargs):
+        return _make_response(200, data[url])
 
     mock_download.side_effect = _mock_download
 
@@ -528,6 +898,28 @@ def test_download_packages_bad_sha(
         assert e.value.code == 1
 
 
+# a package failing validation isn't left in the channel
+@patch("conda_vendor.conda_vendor._improved_download")
+def test_download_packages_bad_sha_removed(
+    mock_download, download_package_lists, download_root
+):
+
+    packages = download_package_lists["packages"]
+    data = download_package_lists["data"]
+
+    packages[0]["sha256"] = hashlib.sha256(b"something else").hexdigest()
+
+    def _mock_download(url, **kwargs):
+        return _make_response(200, data[url])
+
+    mock_download.side_effect = _mock_download
+
+    with pytest.raises(SystemExit) as e:
+        download_packages(packages[:1], download_root)
+    assert e.value.code == 1
+    assert not (download_root / "linux-64" / packages[0]["fn"]).exists()
+
+
 # 404's come back with a valid page
 @patch("conda_vendor.conda_vendor._improved_download")
 def test_download_packages_404(
@@ -539,14 +931,14 @@ def test_download_packages_404(
 
     packages[0]["url"] = "https://github.com/thisshould404.html"
 
-    def _mock_download(url):
-        response = Response()
-        response.status_code = 404
-        response._content = bytes(
-            "<html><body> File not Found! 404 </body></html>",
-            encoding="utf-8",
+    def _mock_download(url, **kwargs):
+        return _make_response(
+            404,
+            bytes(
+                "<html><body> File not Found! 404 </body></html>",
+                encoding="utf-8",
+            ),
         )
-        return response
 
     mock_download.side_effect = _mock_download
     with pytest.raises(SystemExit) as e:
@@ -565,7 +957,7 @@ def test_download_packages_bad_url(
     packages = download_package_lists["packages"]
     data = download_package_lists["data"]
 
-    def _mock_download(url):
+    def _mock_download(url, **kwargs):
         raise ConnectionError()
 
     mock_download.side_effect = _mock_download
@@ -618,3 +1010,278 @@ def test_yaml_dump_ironbank_manifest(
         )
 
         assert expected_packages == actual_packages
+
+
+#####################################################################
+# test vendor
+#####################################################################
+
+
+@pytest.fixture
+def vendor_env(tmp_path_factory):
+    root = tmp_path_factory.mktemp("vendor")
+    env = root / "environment.yml"
+    env.write_text("name: vendor_env\n")
+    package_list = [
+        {
+            "channel": "https://conda.anaconda.org/conda-forge/linux-64",
+            "fn": "fake-1.tar.bz2",
+            "url": "https://conda.anaconda.org/conda-forge/linux-64/fake-1.tar.bz2",
+            "sha256": 64 * "0",
+            "subdir": "linux-64",
+            "timestamp": 0,
+        }
+    ]
+    return root, env, package_list
+
+
+# the repodata is created on another thread while the packages download
+@patch("conda_vendor.conda_vendor.download_packages")
+@patch("conda_vendor.conda_vendor.create_repodata_json")
+@patch("conda_vendor.conda_vendor.solve_environment")
+@patch("conda_vendor.conda_vendor._validate_solver")
+def test_vendor(
+    mock_validate_solver,
+    mock_solve_environment,
+    mock_create_repodata_json,
+    mock_download_packages,
+    vendor_env,
+):
+    root, env, package_list = vendor_env
+    mock_solve_environment.return_value = package_list
+
+    threads = {}
+    mock_create_repodata_json.side_effect = (
+        lambda *args, **kwargs: threads.setdefault(
+            "repodata", threading.get_ident()
+        )
+    )
+    mock_download_packages.side_effect = (
+        lambda *args, **kwargs: threads.setdefault(
+            "download", threading.get_ident()
+        )
+    )
+
+    with set_cwd(root):
+        result = CliRunner().invoke(
+            vendor, ["--file", str(env), "--platform", "linux-64"]
+        )
+
+    assert result.exit_code == 0, result.output
+    vendored_root = root / "vendor_env"
+    mock_create_repodata_json.assert_called_once_with(
+        package_list,
+        vendored_root,
+        "linux-64",
+        list_packages=False,
+        cancel=ANY,
+    )
+    mock_download_packages.assert_called_once_with(
+        package_list, vendored_root, cancel=ANY
+    )
+    assert threads["repodata"] != threads["download"]
+
+    # both sides share the run's cancel event
+    cancel = mock_download_packages.call_args[1]["cancel"]
+    assert mock_create_repodata_json.call_args[1]["cancel"] is cancel
+    assert not cancel.is_set()
+
+
+# the output of the repodata thread is written after the downloads are done
+# rather than into the middle of the download progress bar
+@patch("conda_vendor.conda_vendor.download_packages")
+@patch("conda_vendor.conda_vendor.create_repodata_json")
+@patch("conda_vendor.conda_vendor.solve_environment")
+@patch("conda_vendor.conda_vendor._validate_solver")
+def test_vendor_output(
+    mock_validate_solver,
+    mock_solve_environment,
+    mock_create_repodata_json,
+    mock_download_packages,
+    vendor_env,
+):
+    root, env, package_list = vendor_env
+    mock_solve_environment.return_value = package_list
+
+    repodata_done = threading.Event()
+
+    def _create_repodata_json(*args, **kwargs):
+        conda_vendor.conda_vendor._yellow("repodata output")
+        repodata_done.set()
+
+    def _download_packages(*args, **kwargs):
+        assert repodata_done.wait(timeout=10)
+        conda_vendor.conda_vendor._green("download output")
+
+    mock_create_repodata_json.side_effect = _create_repodata_json
+    mock_download_packages.side_effect = _download_packages
+
+    with set_cwd(root):
+        result = CliRunner().invoke(
+            vendor, ["--file", str(env), "--platform", "linux-64"]
+        )
+
+    assert result.exit_code == 0, result.output
+    # the package listing is printed up front
+    assert result.output.index(package_list[0]["fn"]) < result.output.index(
+        "download output"
+    )
+    assert result.output.index("download output") < result.output.index(
+        "repodata output"
+    )
+
+
+# a failed download doesn't wait for the repodata
+@patch("conda_vendor.conda_vendor.download_packages")
+@patch("conda_vendor.conda_vendor.create_repodata_json")
+@patch("conda_vendor.conda_vendor.solve_environment")
+@patch("conda_vendor.conda_vendor._validate_solver")
+def test_vendor_download_fails(
+    mock_validate_solver,
+    mock_solve_environment,
+    mock_create_repodata_json,
+    mock_download_packages,
+    vendor_env,
+):
+    root, env, package_list = vendor_env
+    mock_solve_environment.return_value = package_list
+
+    release = threading.Event()
+    mock_create_repodata_json.side_effect = lambda *args, **kwargs: (
+        release.wait(timeout=10)
+    )
+    mock_download_packages.side_effect = SystemExit(1)
+
+    try:
+        with set_cwd(root):
+            result = CliRunner().invoke(
+                vendor, ["--file", str(env), "--platform", "linux-64"]
+            )
+        assert result.exit_code == 1
+        assert not release.is_set()
+        assert mock_create_repodata_json.call_args[1]["cancel"].is_set()
+    finally:
+        release.set()
+
+
+# a failed repodata cancels the downloads still running
+@patch("conda_vendor.conda_vendor._improved_download")
+@patch("conda_vendor.conda_vendor.create_repodata_json")
+@patch("conda_vendor.conda_vendor.solve_environment")
+@patch("conda_vendor.conda_vendor._validate_solver")
+def test_vendor_repodata_fails(
+    mock_validate_solver,
+    mock_solve_environment,
+    mock_create_repodata_json,
+    mock_download,
+    vendor_env,
+):
+    root, env, package_list = vendor_env
+    mock_solve_environment.return_value = package_list
+
+    repodata_failed = threading.Event()
+
+    def _create_repodata_json(*args, **kwargs):
+        conda_vendor.conda_vendor._red("repodata failed")
+        repodata_failed.set()
+        sys.exit(1)
+
+    # the download only makes progress once the repodata has failed
+    sent = []
+
+    def _chunks():
+        assert repodata_failed.wait(timeout=10)
+        for _ in range(1000):
+            sent.append(1)
+            yield b"0"
+
+    def _mock_download(url, **kwargs):
+        response = _make_response(200, b"")
+        response.iter_content = lambda **kwargs: _chunks()
+        return response
+
+    mock_create_repodata_json.side_effect = _create_repodata_json
+    mock_download.side_effect = _mock_download
+
+    with set_cwd(root):
+        result = CliRunner().invoke(
+            vendor, ["--file", str(env), "--platform", "linux-64"]
+        )
+
+    assert result.exit_code == 1
+    assert "repodata failed" in result.output
+    assert len(sent) < 1000
+    assert not (root / "vendor_env" / "linux-64" / "fake-1.tar.bz2").exists()
+
+
+# a checksum failure while other packages and the repodata are still
+# downloading is reported as such, not as the cancelled repodata
+@patch("conda_vendor.conda_vendor._improved_download")
+@patch("conda_vendor.conda_vendor.solve_environment")
+@patch("conda_vendor.conda_vendor._validate_solver")
+def test_vendor_bad_sha_cancels_repodata(
+    mock_validate_solver,
+    mock_solve_environment,
+    mock_download,
+    vendor_env,
+    download_package_lists,
+):
+    root, env, _ = vendor_env
+    packages = download_package_lists["packages"]
+    data = download_package_lists["data"]
+    for pkg in packages:
+        pkg.update(channel="https://fake-repo/linux-64", timestamp=0)
+    packages[0]["sha256"] = hashlib.sha256(b"something else").hexdigest()
+    mock_solve_environment.return_value = packages
+
+    def _slow(delay):
+        for _ in range(50):
+            time.sleep(delay)
+            yield b" "
+
+    def _mock_download(url, **kwargs):
+        if url.endswith("repodata_shards.msgpack.zst"):
+            return _make_response(404, b"")
+        if url == packages[0]["url"]:
+            return _make_response(200, data[url])
+        # the repodata and the other packages are still downloading when
+        # the checksum fails
+        response = _make_response(200, b"")
+        delay = 0.01 if url.endswith("repodata.json") else 0.1
+        response.iter_content = lambda **kwargs: _slow(delay)
+        return response
+
+    mock_download.side_effect = _mock_download
+
+    with set_cwd(root):
+        result = CliRunner().invoke(
+            vendor, ["--file", str(env), "--platform", "linux-64"]
+        )
+
+    assert result.exit_code == 1
+    assert isinstance(result.exception, SystemExit)
+    assert "SHA256 Checksum Validation Failed" in result.output
+
+
+# a failed download only cancels the downloads of its own run
+@patch("conda_vendor.conda_vendor._improved_download")
+def test_download_packages_after_failure(
+    mock_download, download_package_lists, download_root, tmp_path
+):
+    packages = download_package_lists["packages"]
+    data = download_package_lists["data"]
+
+    def _mock_download(url, **kwargs):
+        return _make_response(200, data[url])
+
+    mock_download.side_effect = _mock_download
+    bad = deepcopy(packages)
+    bad[0]["sha256"] = hashlib.sha256(b"something else").hexdigest()
+    with pytest.raises(SystemExit):
+        download_packages(bad, download_root)
+
+    (tmp_path / "linux-64").mkdir()
+    download_packages(packages, tmp_path)
+    for pkg in packages:
+        loc = tmp_path / "linux-64" / pkg["fn"]
+        assert loc.read_bytes() == data[pkg["url"]]